@@ -140,7 +140,41 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # 2. MEDIA_URL: The URL prefix used to access the media.
 MEDIA_URL = '/media/'
 
+# Book downloads: when set, download_book_view hands the file to nginx with
+# X-Accel-Redirect to this internal location (see nginx.conf.example) instead
+# of streaming it through the Django worker.
+BOOK_DOWNLOAD_ACCEL_PREFIX = os.environ.get('BOOK_DOWNLOAD_ACCEL_PREFIX', '')
+
+# Largest book file, in bytes, that may be added from a URL.
+MAX_BOOK_BYTES = 200 * 1024 * 1024
+
+# --- Cache Settings ---
+# Catalog pages, the community requests list and Google Books lookups are
+# cached, and saves invalidate them, so all gunicorn workers must share one
+# cache. Set REDIS_URL in production. Without it each process gets its own
+# local-memory cache, which only suits the single-process dev server.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # --- Authentication Settings ---
+# ProfileModelBackend loads the user's RequesterProfile together with the user.
+# ModelBackend stays listed so sessions created before it keep working.
+AUTHENTICATION_BACKENDS = [
+    'books_app.backends.ProfileModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
 LOGIN_URL = 'books_app:login'
 LOGIN_REDIRECT_URL = 'books_app:home'
 LOGOUT_REDIRECT_URL = 'books_app:login'
@@ -1,9 +1,18 @@
+from collections import Counter
 from django.contrib import admin
+from django.db import transaction
 from django.utils import timezone
-from django.db import models
-from django.db.models.functions import Concat # Import Concat for robust string concatenation
-from django.utils.html import format_html
+from django.db.models.functions import Coalesce
 from .models import RequesterProfile, BookAvailable, BookRequest
+from .caching import invalidate_community_requests
+from .templatetags.request_tags import status_badge, whatsapp_link
+
+
+def _is_changelist(model_admin, request):
+    """True when the request is for the model admin's changelist page."""
+    match = request.resolver_match
+    opts = model_admin.opts
+    return bool(match) and match.url_name == f'{opts.app_label}_{opts.model_name}_changelist'
 
 # Register your models
 # We will use custom admin classes for these models
@@ -17,12 +26,40 @@ class RequesterProfileAdmin(admin.ModelAdmin):
     # You could add inlines here to show related BookRequests if desired
     # inlines = [BookRequestInline]
 
+class BookFileListFilter(admin.SimpleListFilter):
+    """
+    Finds books without a file, e.g. URL downloads still running or left
+    behind when the server restarted mid-download, so they can be deleted.
+    """
+    title = 'book file'
+    parameter_name = 'book_file'
+
+    def lookups(self, request, model_admin):
+        return (('missing', 'Missing (download pending or lost)'),)
+
+    def queryset(self, request, queryset):
+        if self.value() == 'missing':
+            return queryset.filter(book_file='')
+        return queryset
+
 # --- Custom Admin for BookAvailable ---
 @admin.register(BookAvailable)
 class BookAvailableAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'isbn', 'is_available', 'published_date')
+    list_display = ('title', 'author', 'isbn', 'is_available', 'published_date', 'request_count', 'fulfilled_count')
     search_fields = ('title', 'author', 'isbn')
-    list_filter = ('is_available', 'published_date')
+    list_filter = ('is_available', BookFileListFilter, 'published_date')
+    # A stable order keeps the book_requested autocomplete's pages from overlapping.
+    ordering = ('title',)
+
+    def get_queryset(self, request):
+        """
+        The changelist doesn't show the book or cover files, so skip loading
+        those columns and building their FieldFile wrappers for every row.
+        """
+        queryset = super().get_queryset(request)
+        if _is_changelist(self, request):
+            queryset = queryset.defer('book_file', 'cover_image')
+        return queryset
 
 # --- Custom Admin for BookRequest ---
 @admin.register(BookRequest)
@@ -33,10 +70,13 @@ class BookRequestAdmin(admin.ModelAdmin):
         'colored_status', # Add the new colored status display
         'status', 
         'request_date', 
-        'get_whatsapp_link' # Custom method from the model
+        'get_whatsapp_link' # Custom method for contacting the requester
     )
     list_editable = ('status',) # Make the status field directly editable in the list view
     list_filter = ('status', 'request_date')
+    list_per_page = 50
+    # Skip the unfiltered COUNT(*) the changelist runs alongside filtered results
+    show_full_result_count = False
 
     # Enhance search fields to include direct book title/author for unlinked requests
     search_fields = (
@@ -47,7 +87,9 @@ class BookRequestAdmin(admin.ModelAdmin):
         'book_title', # Search directly on the requested title if not linked
         'book_author' # Search directly on the requested author if not linked
     )
-    readonly_fields = ('request_date', 'fulfillment_date', 'requester', 'book_title', 'book_author')
+    readonly_fields = ('request_date', 'fulfillment_date', 'requester', 'book_title', 'book_author', 'last_auto_note')
+    # Search books over AJAX instead of rendering the whole catalog into a <select>
+    autocomplete_fields = ('book_requested',)
 
     # Organize the admin detail view for better clarity
     fieldsets = (
@@ -55,36 +97,55 @@ class BookRequestAdmin(admin.ModelAdmin):
             'fields': ('requester', ('book_title', 'book_author'), 'status', 'request_date')
         }),
         ('Fulfillment (Admin Use)', {
-            'fields': ('book_requested', 'fulfillment_date', 'admin_notes')
+            'fields': ('book_requested', 'fulfillment_date', 'admin_notes', 'last_auto_note')
         }),
     )
     
+    # Columns actually rendered on the changelist; everything else stays deferred.
+    changelist_only_fields = (
+        'requester', 'book_requested', 'status', 'request_date', 'book_title', 'book_author',
+        'requester__whatsapp_name', 'requester__whatsapp_number',
+        'requester__user', 'requester__user__username', 'requester__user__email',
+        'book_requested__title', 'book_requested__author',
+    )
+
+    def get_queryset(self, request):
+        """
+        Narrows the SELECT on the changelist to the columns it displays, so wide
+        fields like admin_notes and the book's file paths are never fetched.
+        """
+        # requester__user is a OneToOne, so it rides the same JOIN and any
+        # display code touching requester.user won't fire a query per row.
+        queryset = super().get_queryset(request).select_related('requester__user', 'book_requested').annotate(
+            # Prefer the linked catalog book, falling back to what the user typed.
+            display_title=Coalesce('book_requested__title', 'book_title'),
+            display_author=Coalesce('book_requested__author', 'book_author'),
+        )
+        if _is_changelist(self, request):
+            queryset = queryset.only(*self.changelist_only_fields)
+        return queryset
+
     # Add a custom method to display the requested book details
     def get_requested_book_display(self, obj):
         """
         Displays the book title and author, prioritizing linked BookAvailable
         over the manually entered book_title/book_author.
         """
-        if obj.book_requested:
-            return f"{obj.book_requested.title} by {obj.book_requested.author}"
-        return f"{obj.book_title} by {obj.book_author}" if obj.book_author else obj.book_title
+        if obj.display_author:
+            return f"{obj.display_title} by {obj.display_author}"
+        return obj.display_title
     get_requested_book_display.short_description = 'Requested Book'
-    get_requested_book_display.admin_order_field = 'book_title' # Allows sorting by this field
+    get_requested_book_display.admin_order_field = 'display_title' # Allows sorting by this field
     
     @admin.display(description='Status', ordering='status')
     def colored_status(self, obj):
-        """
-        Displays the status field with a color for quick visual scanning.
-        Green for fulfilled, Red for pending/rejected states.
-        """
-        if obj.status == 'FULFILLED':
-            color = 'green'
-        elif obj.status in ['PENDING', 'REJECTED', 'CONTACT']:
-            color = 'red'
-        else:
-            color = 'black' # Fallback
-        
-        return format_html('<b style="color: {};">{}</b>', color, obj.get_status_display())
+        """Displays the status field with a color for quick visual scanning."""
+        return status_badge(obj.status)
+
+    @admin.display(description='WhatsApp')
+    def get_whatsapp_link(self, obj):
+        """Link for the admin to contact the requester quickly."""
+        return whatsapp_link(obj)
 
     # Add the custom action
     actions = ['mark_as_fulfilled']
@@ -94,15 +155,25 @@ class BookRequestAdmin(admin.ModelAdmin):
         """
         Custom Admin Action to quickly mark selected requests as completed.
         """
-        updated_count = queryset.filter(status__in=['PENDING', 'CONTACT']).update(
-            status='FULFILLED',
-            fulfillment_date=timezone.now(),
-            admin_notes=Concat(
-                models.F('admin_notes'),
-                models.Value(f'\nAutomatically marked fulfilled by Admin on {timezone.now().date()}.'),
-                output_field=models.TextField()
+        # Read the clock once so the date and the note agree for every row.
+        now = timezone.now()
+        to_fulfill = queryset.filter(status__in=[BookRequest.Status.PENDING, BookRequest.Status.CONTACT])
+        with transaction.atomic():
+            # update() skips the save signals, so bump each linked book's fulfilled_count here.
+            # Lock the rows being counted so a concurrent status change can't
+            # slip in between the count and the update.
+            locked = to_fulfill.select_for_update(of=('self',))
+            per_book = Counter(
+                book_id for book_id in locked.values_list('book_requested_id', flat=True) if book_id
             )
-        )
+            updated_count = to_fulfill.update(
+                status=BookRequest.Status.FULFILLED,
+                fulfillment_date=now,
+                last_auto_note=f'Automatically marked fulfilled by Admin on {now.date()}.'
+            )
+            for book_id, count in per_book.items():
+                BookAvailable.adjust_request_counts(book_id, fulfilled=count)
+        invalidate_community_requests()
         self.message_user(
             request, 
             f'{updated_count} request(s) were successfully marked as Fulfilled and timestamped.'
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BooksAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'books_app'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401 (registers the checks, connects the signal receivers)
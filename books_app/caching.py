@@ -0,0 +1,36 @@
+"""
+Versioned cache keys for the pages that are the same for every user.
+
+Each cached page is keyed under the current version of its list, so
+replacing the version drops every page of that list at once; the orphaned
+entries simply expire. signals.py and the admin invalidate, views read.
+"""
+import uuid
+
+from django.core.cache import cache
+
+# Home catalog pages and their counts, per search term (views.home).
+HOME_CATALOG_VERSION_KEY = 'home:version'
+
+# Community requests list pages (all_requests.html fragment cache).
+COMMUNITY_REQUESTS_VERSION_KEY = 'community_requests:version'
+
+
+def home_catalog_version():
+    """The current version of the cached home catalog pages."""
+    return cache.get_or_set(HOME_CATALOG_VERSION_KEY, lambda: uuid.uuid4().hex, None)
+
+
+def invalidate_home_catalog():
+    """Drops every cached home catalog page and count."""
+    cache.set(HOME_CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def community_requests_version():
+    """The current version of the cached community requests pages."""
+    return cache.get_or_set(COMMUNITY_REQUESTS_VERSION_KEY, lambda: uuid.uuid4().hex, None)
+
+
+def invalidate_community_requests():
+    """Drops every cached page of the community requests list."""
+    cache.set(COMMUNITY_REQUESTS_VERSION_KEY, uuid.uuid4().hex, None)
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Cached pages are invalidated by saves in whichever worker handles them,
+    which only reaches the other workers if they share the cache.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend.endswith('.LocMemCache'):
+        return [
+            Warning(
+                "The default cache is local to each process, so cached pages "
+                "aren't invalidated in other gunicorn workers.",
+                hint="Set REDIS_URL so all workers share one cache.",
+                id='books_app.W001',
+            )
+        ]
+    return []
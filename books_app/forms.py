@@ -1,6 +1,10 @@
+import requests
 from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm, PasswordChangeForm
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
 from .models import RequesterProfile, BookRequest, BookAvailable
 
 class CustomUserCreationForm(UserCreationForm):
@@ -38,14 +42,16 @@ class CustomUserCreationForm(UserCreationForm):
     def save(self, commit=True):
         user = super().save(commit=False)
         if commit:
-            user.save()
-            # Create the associated RequesterProfile
-            RequesterProfile.objects.create(
-                user=user,
-                whatsapp_name=user.username,
-                whatsapp_number=self.cleaned_data.get('whatsapp_number'),
-                profile_picture=self.cleaned_data.get('profile_picture')
-            )
+            # Both rows are written in one transaction: a single commit, and no
+            # orphaned User if the profile update fails.
+            with transaction.atomic():
+                # Saving the user creates its RequesterProfile (see signals.py);
+                # fill in the details collected at signup.
+                user.save()
+                profile = user.requesterprofile
+                profile.whatsapp_number = self.cleaned_data.get('whatsapp_number')
+                profile.profile_picture = self.cleaned_data.get('profile_picture')
+                profile.save(update_fields=['whatsapp_number', 'profile_picture'])
         return user
 
 class UserUpdateForm(forms.ModelForm):
@@ -109,6 +115,31 @@ class BookUploadURLForm(forms.ModelForm):
         required=False
     )
 
+    def clean_book_url(self):
+        """
+        Asks the server about the file before anything is downloaded, so an
+        oversized file is rejected right away. Servers that don't answer HEAD
+        are let through; the download itself enforces the same limit.
+        """
+        book_url = self.cleaned_data.get('book_url')
+        self.book_content_type = None
+        try:
+            # A plain request, without download_session's retries: this runs while
+            # the user waits, so a host that never answers costs one short timeout.
+            head = requests.head(book_url, allow_redirects=True, timeout=3)
+        except requests.exceptions.RequestException:
+            return book_url
+        if not head.ok:
+            return book_url
+
+        size = head.headers.get('Content-Length')
+        if size and size.isdigit() and int(size) > settings.MAX_BOOK_BYTES:
+            raise forms.ValidationError(
+                f"This file is {filesizeformat(int(size))}; books can be at most {filesizeformat(settings.MAX_BOOK_BYTES)}."
+            )
+        self.book_content_type = head.headers.get('Content-Type', '').split(';')[0].strip() or None
+        return book_url
+
     class Meta:
         model = BookAvailable
         # 'book_file' is excluded because we're providing a URL instead.
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-15 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0009_bookavailable_download_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(fields=['status', 'request_date'], name='books_app_b_status_e40e8e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(fields=['requester', 'request_date'], name='books_app_b_request_7b4dcd_idx'),
+        ),
+    ]
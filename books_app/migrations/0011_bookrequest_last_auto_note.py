@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-15 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0010_bookrequest_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookrequest',
+            name='last_auto_note',
+            field=models.CharField(blank=True, help_text='Set automatically by bulk admin actions.', max_length=80),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-15 04:06
+
+from django.db import migrations, models
+
+
+# Old VARCHAR status codes and the integers that replace them.
+STATUS_CODES = {
+    'PENDING': '1',
+    'FULFILLED': '2',
+    'REJECTED': '3',
+    'CONTACT': '4',
+}
+
+
+def codes_to_numbers(apps, schema_editor):
+    BookRequest = apps.get_model('books_app', 'BookRequest')
+    for code, number in STATUS_CODES.items():
+        BookRequest.objects.filter(status=code).update(status=number)
+
+
+def numbers_to_codes(apps, schema_editor):
+    BookRequest = apps.get_model('books_app', 'BookRequest')
+    for code, number in STATUS_CODES.items():
+        BookRequest.objects.filter(status=number).update(status=code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0011_bookrequest_last_auto_note'),
+    ]
+
+    operations = [
+        # Rewrite the codes as digit strings first so the column can be cast to an integer.
+        migrations.RunPython(codes_to_numbers, numbers_to_codes),
+        migrations.AlterField(
+            model_name='bookrequest',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Pending Review'), (2, 'Fulfilled (Sent to User)'), (3, 'Rejected (e.g., Book Not Found)'), (4, 'Contact Required (Issue with Request)')], default=1),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+# Trigram GIN indexes let PostgreSQL serve the admin's and home page's
+# icontains (ILIKE '%term%') searches on title/author from an index.
+# They are PostgreSQL-only, so other backends (e.g. the SQLite dev database) skip them.
+TRIGRAM_INDEXES = {
+    'book_title_trgm': 'title',
+    'book_author_trgm': 'author',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON books_app_bookavailable USING gin ({column} gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0012_bookrequest_status_smallint'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
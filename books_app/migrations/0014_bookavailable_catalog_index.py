@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-15 04:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0013_bookavailable_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookavailable',
+            index=models.Index(fields=['-published_date', 'title'], name='books_app_b_publish_bb810f_idx'),
+        ),
+    ]
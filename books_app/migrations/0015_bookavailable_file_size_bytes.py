@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-15 04:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0014_bookavailable_catalog_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookavailable',
+            name='file_size_bytes',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, help_text='Size of book_file, recorded on save so listings never have to ask the storage.', null=True),
+        ),
+    ]
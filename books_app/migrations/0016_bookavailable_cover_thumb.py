@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-15 04:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0015_bookavailable_file_size_bytes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookavailable',
+            name='cover_thumb',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='books/covers/thumbs/'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-15 04:14
+
+from django.db import migrations, models
+
+
+def mark_existing_pdfs(apps, schema_editor):
+    BookAvailable = apps.get_model('books_app', 'BookAvailable')
+    BookAvailable.objects.filter(book_file__iendswith='.pdf').update(file_kind='pdf')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0016_bookavailable_cover_thumb'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookavailable',
+            name='file_kind',
+            field=models.CharField(choices=[('pdf', 'PDF'), ('other', 'Other')], default='other', editable=False, max_length=8),
+        ),
+        migrations.RunPython(mark_existing_pdfs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-15 04:15
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_existing_requests(apps, schema_editor):
+    BookAvailable = apps.get_model('books_app', 'BookAvailable')
+    counts = BookAvailable.objects.annotate(
+        requests=Count('bookrequest'),
+        fulfilled=Count('bookrequest', filter=Q(bookrequest__status=2)), # BookRequest.Status.FULFILLED
+    ).filter(requests__gt=0)
+    for book in counts:
+        BookAvailable.objects.filter(pk=book.pk).update(request_count=book.requests, fulfilled_count=book.fulfilled)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0017_bookavailable_file_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookavailable',
+            name='fulfilled_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of fulfilled requests linked to this book.'),
+        ),
+        migrations.AddField(
+            model_name='bookavailable',
+            name='request_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of requests linked to this book.'),
+        ),
+        migrations.RunPython(count_existing_requests, migrations.RunPython.noop),
+    ]
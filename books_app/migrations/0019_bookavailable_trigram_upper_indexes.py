@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+# On PostgreSQL Django compiles title__icontains to
+# UPPER("title"::text) LIKE UPPER('%term%'), which the plain-column trigram
+# indexes from 0013 can't serve. Rebuild them over that same expression.
+# PostgreSQL-only, like 0013.
+TRIGRAM_INDEXES = {
+    'book_title_trgm': 'title',
+    'book_author_trgm': 'author',
+}
+
+
+def create_upper_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+        schema_editor.execute(
+            f'CREATE INDEX {name} ON books_app_bookavailable USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+
+
+def restore_column_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+        schema_editor.execute(
+            f'CREATE INDEX {name} ON books_app_bookavailable USING gin ({column} gin_trgm_ops)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0018_bookavailable_request_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_upper_trigram_indexes, restore_column_trigram_indexes),
+    ]
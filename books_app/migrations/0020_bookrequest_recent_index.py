@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-15 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0019_bookavailable_trigram_upper_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(fields=['-request_date', '-id'], name='books_app_b_request_688396_idx'),
+        ),
+    ]
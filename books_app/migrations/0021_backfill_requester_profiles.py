@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def create_missing_profiles(apps, schema_editor):
+    # Every user now gets a RequesterProfile when created; give the users made
+    # before that (e.g. superusers) one too, so views can rely on it.
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    RequesterProfile = apps.get_model('books_app', 'RequesterProfile')
+    RequesterProfile.objects.bulk_create(
+        RequesterProfile(user_id=user_id, whatsapp_name=username)
+        for user_id, username in User.objects.filter(requesterprofile__isnull=True).values_list('pk', 'username')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0020_bookrequest_recent_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_profiles, migrations.RunPython.noop),
+    ]
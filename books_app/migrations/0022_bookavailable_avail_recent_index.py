@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-15 04:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0021_backfill_requester_profiles'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bookavailable',
+            name='books_app_b_publish_bb810f_idx',
+        ),
+        migrations.AddIndex(
+            model_name='bookavailable',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['-published_date', 'title'], name='avail_recent'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def store_file_sizes(apps, schema_editor):
+    # Rows uploaded before file_size_bytes existed would otherwise stat their
+    # file on every catalog render. Files missing from storage stay NULL.
+    BookAvailable = apps.get_model('books_app', 'BookAvailable')
+    books = BookAvailable.objects.filter(file_size_bytes__isnull=True).exclude(book_file='').only('book_file')
+    sized = []
+    for book in books.iterator():
+        try:
+            book.file_size_bytes = book.book_file.size
+        except OSError:
+            continue
+        sized.append(book)
+    BookAvailable.objects.bulk_update(sized, ['file_size_bytes'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0022_bookavailable_avail_recent_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(store_file_sizes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# Frozen copies of models.PDF_MAGIC and models.PDF_HEADER_WINDOW.
+PDF_MAGIC = b'%PDF-'
+PDF_HEADER_WINDOW = 1024
+
+
+def sniff_file_kinds(apps, schema_editor):
+    # 0017 guessed the kind of existing files from their extension, while
+    # save() now reads the file's header. Redo the old rows the same way so a
+    # book's kind doesn't depend on when it was uploaded.
+    BookAvailable = apps.get_model('books_app', 'BookAvailable')
+    changed = []
+    for book in BookAvailable.objects.exclude(book_file='').only('book_file', 'file_kind').iterator():
+        try:
+            with book.book_file.open('rb') as stored:
+                head = stored.read(PDF_HEADER_WINDOW)
+        except (ValueError, OSError):
+            head = b''
+        kind = 'pdf' if PDF_MAGIC in head else 'other'
+        if kind != book.file_kind:
+            book.file_kind = kind
+            changed.append(book)
+    BookAvailable.objects.bulk_update(changed, ['file_kind'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0023_backfill_file_size_bytes'),
+    ]
+
+    operations = [
+        migrations.RunPython(sniff_file_kinds, migrations.RunPython.noop),
+    ]
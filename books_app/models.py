@@ -1,17 +1,52 @@
 from django.db import models
-from django.utils.safestring import mark_safe # This is needed for rendering HTML in templates
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
 from urllib.parse import quote
 import os
+import hashlib
+import shutil
+import tempfile
+import io
+import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from PIL import Image
+from django.core.cache import cache
 from django.core.files.base import ContentFile
-import io
+from django.utils.functional import cached_property
+from .tasks import run_in_background, run_in_process, populate_cover, render_first_page_jpeg
 
 try:
     import fitz # PyMuPDF
 except ImportError:
     fitz = None # Define fitz as None if the import fails
 
+logger = logging.getLogger(__name__)
+
+# How long Google Books search results and thumbnails are kept in the cache (7 days).
+GOOGLE_BOOKS_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Shared HTTP session for Google Books: keeps connections (and TLS sessions)
+# alive between lookups and retries transient gateway errors.
+_GBOOKS = requests.Session()
+_GBOOKS_ADAPTER = HTTPAdapter(
+    pool_connections=10, pool_maxsize=10,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504)),
+)
+# Thumbnail links from the API are often plain http, so mount both schemes.
+_GBOOKS.mount('https://', _GBOOKS_ADAPTER)
+_GBOOKS.mount('http://', _GBOOKS_ADAPTER)
+_GBOOKS.headers.update({'Accept-Encoding': 'gzip', 'User-Agent': 'ebooks-supply/1.0'})
+
+# Every PDF starts with this signature; readers accept it anywhere in the
+# first kilobyte, so look there rather than only at byte 0.
+PDF_MAGIC = b'%PDF-'
+PDF_HEADER_WINDOW = 1024
+
+# Bounding box, in pixels, of the cover thumbnails shown in catalog listings.
+COVER_THUMB_SIZE = (256, 256)
+
 # --- Helper Model: Profile of the WhatsApp Requester ---
 class RequesterProfile(models.Model):
     """
@@ -50,6 +85,10 @@ class BookAvailable(models.Model):
     The main catalog of ebooks available for request. 
     This is likely the model you were working on.
     """
+    class FileKind(models.TextChoices):
+        PDF = 'pdf', 'PDF'
+        OTHER = 'other', 'Other'
+
     title = models.CharField(max_length=200)
     author = models.CharField(max_length=100)
     isbn = models.CharField(max_length=13, unique=True, blank=True, null=True)
@@ -57,8 +96,15 @@ class BookAvailable(models.Model):
     # Stores the actual file (PDF, EPUB, etc.) on the server.
     book_file = models.FileField(upload_to='books/files/') 
     
+    # Kind of book_file, sniffed from its content once on save (0024 did the
+    # same for books uploaded earlier) so templates can check it without
+    # string work or loading book_file.
+    file_kind = models.CharField(max_length=8, choices=FileKind.choices, default=FileKind.OTHER, editable=False)
+
     # Stores the cover image file.
     cover_image = models.ImageField(upload_to='books/covers/', blank=True, null=True) 
+    # Small JPEG made from cover_image for catalog listings; filled in by a background job.
+    cover_thumb = models.ImageField(upload_to='books/covers/thumbs/', blank=True, null=True, editable=False)
 
     published_date = models.DateField(blank=True, null=True)
     is_available = models.BooleanField(default=True)
@@ -66,16 +112,67 @@ class BookAvailable(models.Model):
     # --- Tracking Fields ---
     view_count = models.PositiveIntegerField(default=0, help_text="Number of times the book detail page has been viewed.")
     download_count = models.PositiveIntegerField(default=0, help_text="Number of times the book has been downloaded.")
+    # Kept in step with BookRequest by signals (see signals.py), so showing them never needs an aggregate query.
+    request_count = models.PositiveIntegerField(default=0, editable=False, help_text="Number of requests linked to this book.")
+    fulfilled_count = models.PositiveIntegerField(default=0, editable=False, help_text="Number of fulfilled requests linked to this book.")
+    file_size_bytes = models.PositiveBigIntegerField(
+        null=True, blank=True, editable=False,
+        help_text="Size of book_file, recorded on save so listings never have to ask the storage."
+    )
 
     def __str__(self):
         return f"{self.title} by {self.author}"
 
+    @classmethod
+    def adjust_request_counts(cls, book_id, requests=0, fulfilled=0):
+        """
+        Atomically shifts a book's request/fulfilled counters by the given amounts.
+
+        The results are clamped at zero: the columns are unsigned, and a counter
+        that has drifted low must not make deleting a request (or the profile
+        or user it cascades from) fail.
+        """
+        if not book_id or not (requests or fulfilled):
+            return
+        cls.objects.filter(pk=book_id).update(
+            request_count=Greatest(models.F('request_count') + requests, 0),
+            fulfilled_count=Greatest(models.F('fulfilled_count') + fulfilled, 0),
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored cover (unless deferred) so save() can tell when
+        # it was cleared or swapped for another file.
+        if 'cover_image' in instance.__dict__:
+            instance._loaded_cover_name = instance.__dict__['cover_image'] or ''
+        return instance
+
+    def _detect_file_kind(self):
+        """
+        Sniffs book_file for the PDF signature, so a file named .pdf that
+        isn't one doesn't get a preview or a rendered cover (and one without
+        the extension still does). A fresh upload is read in place; a file
+        already in storage only has its first kilobyte read.
+        """
+        try:
+            if self.book_file._committed:
+                with self.book_file.open('rb') as stored:
+                    head = stored.read(PDF_HEADER_WINDOW)
+            else:
+                upload = self.book_file.file
+                position = upload.tell()
+                upload.seek(0)
+                head = upload.read(PDF_HEADER_WINDOW)
+                upload.seek(position)
+        except (FileNotFoundError, ValueError, OSError):
+            return self.FileKind.OTHER
+        return self.FileKind.PDF if PDF_MAGIC in head else self.FileKind.OTHER
+
     @property
     def is_pdf(self):
         """Checks if the book_file is a PDF for preview purposes."""
-        if self.book_file and self.book_file.name:
-            return self.book_file.name.lower().endswith('.pdf')
-        return False
+        return self.file_kind == self.FileKind.PDF
 
     def fetch_cover_from_google_books(self):
         """
@@ -88,13 +185,18 @@ class BookAvailable(models.Model):
         # Prepare the user-provided author name for comparison (lowercase, simple)
         user_author_normalized = self.author.lower().strip()
 
-        search_term = f"{self.title} {self.author}"
+        # Normalize case/whitespace so near-identical titles share one cached lookup.
+        search_term = f"{self.title.lower().strip()} {user_author_normalized}"
         api_url = f"https://www.googleapis.com/books/v1/volumes?q={quote(search_term)}"
+        search_cache_key = f"gbooks:search:{hashlib.sha1(search_term.encode()).hexdigest()}"
 
         try:
-            response = requests.get(api_url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = cache.get(search_cache_key)
+            if data is None:
+                response = _GBOOKS.get(api_url, timeout=10)
+                response.raise_for_status()
+                data = response.json()
+                cache.set(search_cache_key, data, GOOGLE_BOOKS_CACHE_TIMEOUT)
 
             if data.get('totalItems', 0) > 0:
                 # Iterate through the first few results to find a better match
@@ -115,10 +217,15 @@ class BookAvailable(models.Model):
                         if image_links:
                             image_url = image_links.get('thumbnail') or image_links.get('smallThumbnail')
                             if image_url:
-                                img_response = requests.get(image_url, timeout=10)
-                                img_response.raise_for_status()
+                                image_cache_key = f"gbooks:img:{hashlib.sha1(image_url.encode()).hexdigest()}"
+                                image_bytes = cache.get(image_cache_key)
+                                if image_bytes is None:
+                                    img_response = _GBOOKS.get(image_url, timeout=10)
+                                    img_response.raise_for_status()
+                                    image_bytes = img_response.content
+                                    cache.set(image_cache_key, image_bytes, GOOGLE_BOOKS_CACHE_TIMEOUT)
                                 file_name = f"{self.title.replace(' ', '_')}_cover.jpg"
-                                self.cover_image.save(file_name, ContentFile(img_response.content), save=False)
+                                self.cover_image.save(file_name, ContentFile(image_bytes), save=False)
                                 return True # Success, exit the function
 
         except requests.exceptions.RequestException:
@@ -132,68 +239,139 @@ class BookAvailable(models.Model):
         This is used as a fallback if Google Books API fails.
         Requires PyMuPDF (fitz) to be installed.
         """
-        if not fitz or not self.book_file or not self.book_file.name.lower().endswith('.pdf'):
+        if not fitz or not self.book_file or not self.is_pdf:
             return False
 
         try:
-            # Open the PDF file from storage
-            with self.book_file.open('rb') as file_stream:
-                pdf_document = fitz.open(stream=file_stream.read(), filetype="pdf")
+            # Render in the process pool so the rasterizing runs outside this process.
+            # The renderer opens the file by path rather than receiving its bytes.
+            try:
+                pdf_path = self.book_file.path
+            except NotImplementedError:
+                pdf_path = None # Remote storage without local paths
+
+            if pdf_path:
+                img_bytes = run_in_process(render_first_page_jpeg, pdf_path)
+            else:
+                # Copy to a local temp file in small chunks, never holding the whole PDF in memory
+                with self.book_file.open('rb') as file_stream, tempfile.NamedTemporaryFile(suffix='.pdf') as tmp:
+                    shutil.copyfileobj(file_stream, tmp)
+                    tmp.flush()
+                    img_bytes = run_in_process(render_first_page_jpeg, tmp.name)
                 
-                if len(pdf_document) > 0:
-                    first_page = pdf_document.load_page(0)
-                    pix = first_page.get_pixmap(dpi=150) # Render page to an image
-                    
-                    # Save the image bytes to a buffer
-                    img_buffer = io.BytesIO(pix.tobytes("png"))
-                    
-                    # Create a file name and save it to the cover_image field
-                    file_name = f"{self.title.replace(' ', '_')}_cover.png"
-                    self.cover_image.save(file_name, ContentFile(img_buffer.getvalue()), save=False)
-                    return True
+            if img_bytes:
+                # Create a file name and save it to the cover_image field
+                file_name = f"{self.title.replace(' ', '_')}_cover.jpg"
+                self.cover_image.save(file_name, ContentFile(img_bytes), save=False)
+                return True
         except Exception:
-            # Silently fail if there's an error processing the PDF
-            pass
+            # Fall back to no cover, but leave a trace: a crashing renderer or a
+            # broken render pool would otherwise go unnoticed.
+            logger.warning("Rendering a cover from the PDF of book %s failed", self.pk, exc_info=True)
         return False
 
+    def generate_cover_thumbnail(self):
+        """
+        Builds cover_thumb from cover_image: a progressive JPEG no larger than
+        COVER_THUMB_SIZE, so listings don't ship the full-size cover.
+        """
+        if not self.cover_image:
+            return False
+
+        try:
+            with self.cover_image.open('rb') as image_file:
+                image = Image.open(image_file)
+                image.thumbnail(COVER_THUMB_SIZE, Image.LANCZOS)
+                buffer = io.BytesIO()
+                image.convert('RGB').save(buffer, format='JPEG', quality=75, progressive=True, optimize=True)
+        except (OSError, ValueError):
+            # Missing or unreadable cover; listings fall back to cover_image.
+            return False
+
+        file_name = f"{self.title.replace(' ', '_')}_thumb.jpg"
+        self.cover_thumb.save(file_name, ContentFile(buffer.getvalue()), save=False)
+        return True
+
     def save(self, *args, **kwargs):
         """
         Overrides the default save method to automatically handle cover images.
         First, it saves the book (including the file). Then, if it's a new book
-        without a cover, it tries to fetch or generate one and saves again.
+        without a cover or the cover changed, it schedules a background job to
+        fetch or generate the cover and its thumbnail, so the network, PDF and
+        image work never delays the response.
         """
+        # Partial saves (e.g. the cover job writing cover_image) only write the
+        # listed columns and never need the bookkeeping below.
+        if kwargs.get('update_fields') is not None:
+            super().save(*args, **kwargs)
+            return
+
         # Determine if this is a new instance before the initial save.
         is_new_instance = self.pk is None
 
+        # The thumbnail is made from the cover, so it goes stale when the cover
+        # is cleared, a new one is uploaded, or it points at another file.
+        cover_uploaded = bool(self.cover_image) and not self.cover_image._committed
+        loaded_cover_name = getattr(self, '_loaded_cover_name', None)
+        cover_replaced = loaded_cover_name is not None and (self.cover_image.name or '') != loaded_cover_name
+        if not self.cover_image or cover_uploaded or cover_replaced:
+            self.cover_thumb = None
+
+        # Work out the kind of a new or replaced file from its content; an
+        # existing book's stored file keeps the kind it was given.
+        if not self.book_file:
+            self.file_kind = self.FileKind.OTHER
+        elif is_new_instance or not self.book_file._committed:
+            self.file_kind = self._detect_file_kind()
+
+        # Record the file size when a file is first stored or replaced. A fresh
+        # upload knows its own size, so this doesn't touch the storage.
+        if self.book_file:
+            if self.file_size_bytes is None or not self.book_file._committed:
+                try:
+                    self.file_size_bytes = self.book_file.size
+                except (FileNotFoundError, ValueError, OSError):
+                    self.file_size_bytes = None
+
         # Perform the initial save. This is crucial for the file to exist on storage.
         super().save(*args, **kwargs)
+        self._loaded_cover_name = self.cover_image.name or ''
 
-        # If it's a new book and the user did not provide a cover, try to find/generate one.
-        if is_new_instance and not self.cover_image:
-            # Try fetching from Google, if that fails, try generating from PDF.
-            if self.fetch_cover_from_google_books() or self.generate_cover_from_pdf():
-                # If a cover was found, save the instance again, but only update the cover field
-                # to prevent recursion and re-running the whole save method.
-                super().save(update_fields=['cover_image'])
+        # If it's a new book without a cover, or the cover was just replaced,
+        # find/generate the cover and its thumbnail once the row is committed.
+        # A book still waiting for its file (a URL download) gets its cover
+        # from the download job instead.
+        if (is_new_instance and self.book_file and not self.cover_image) or cover_uploaded:
+            run_in_background(populate_cover, self.pk)
 
-    def get_file_size(self):
+    @cached_property
+    def file_size_display(self):
         """Returns the file size in a human-readable format (KB, MB)."""
-        try:
-            if self.book_file and self.book_file.storage.exists(self.book_file.name):
-                size = self.book_file.size
-                if size < 1024:
-                    return f"{size} B"
-                elif size < 1024**2:
-                    return f"{size/1024:.1f} KB"
-                else:
-                    return f"{size/1024**2:.1f} MB"
-        except (FileNotFoundError, ValueError):
-            # If the file doesn't exist on storage, return None gracefully.
+        size = self.file_size_bytes
+        if size is None:
+            # Files that were missing when 0023 backfilled the sizes; ask the storage once.
+            try:
+                size = self.book_file.size if self.book_file else None
+            except (FileNotFoundError, ValueError, OSError):
+                # If the file doesn't exist on storage, return None gracefully.
+                return None
+        if size is None:
             return None
-        return None
-    get_file_size.short_description = 'File Size'
+        if size < 1024:
+            return f"{size} B"
+        elif size < 1024**2:
+            return f"{size/1024:.1f} KB"
+        else:
+            return f"{size/1024**2:.1f} MB"
     
     class Meta:
+        indexes = [
+            # Matches the home page filter and ordering so the catalog is read
+            # in index order; books hidden from the catalog are left out of it.
+            models.Index(
+                fields=['-published_date', 'title'], name='avail_recent', condition=models.Q(is_available=True)
+            ),
+        ]
         verbose_name = "Available Book"
         verbose_name_plural = "Available Books"    
 
@@ -202,12 +380,12 @@ class BookRequest(models.Model):
     """
     A record of a user's request for a specific book.
     """
-    STATUS_CHOICES = (
-        ('PENDING', 'Pending Review'),
-        ('FULFILLED', 'Fulfilled (Sent to User)'),
-        ('REJECTED', 'Rejected (e.g., Book Not Found)'),
-        ('CONTACT', 'Contact Required (Issue with Request)')
-    )
+    class Status(models.IntegerChoices):
+        # Stored as a 2-byte integer rather than a VARCHAR code.
+        PENDING = 1, 'Pending Review'
+        FULFILLED = 2, 'Fulfilled (Sent to User)'
+        REJECTED = 3, 'Rejected (e.g., Book Not Found)'
+        CONTACT = 4, 'Contact Required (Issue with Request)'
     
     requester = models.ForeignKey(RequesterProfile, on_delete=models.CASCADE)
     # Link to an existing book if it's in the catalog, otherwise it's a new request.
@@ -218,10 +396,9 @@ class BookRequest(models.Model):
     book_author = models.CharField(max_length=100, blank=True, help_text="Author of the requested book.")
     
     # The status of the request
-    status = models.CharField(
-        max_length=10, 
-        choices=STATUS_CHOICES, 
-        default='PENDING'
+    status = models.PositiveSmallIntegerField(
+        choices=Status.choices, 
+        default=Status.PENDING
     )
 
     
@@ -230,43 +407,22 @@ class BookRequest(models.Model):
     
     # Notes for the admin (you) to track issues or confirmation details.
     admin_notes = models.TextField(blank=True, help_text="Notes on fulfillment, 'Sent via WhatsApp on 2025-10-23'.")
+    # Short note written by bulk admin actions, kept apart from admin_notes so the
+    # action doesn't have to rewrite a potentially large text column on every row.
+    last_auto_note = models.CharField(max_length=80, blank=True, help_text="Set automatically by bulk admin actions.")
 
     def __str__(self):
         return f"Request by {self.requester.whatsapp_name} for {self.book_title}"
 
-    def get_whatsapp_link(self):
-        """Generates a WhatsApp link for the admin to contact the user quickly."""
-        number = self.requester.whatsapp_number
-        if not number:
-            return mark_safe('<span style="color: red;">Number Missing</span>')
-
-        # Generate a message to pre-fill the chat
-        message = f"Hello {self.requester.whatsapp_name}, regarding your request for the book: '{self.book_title}'."
-        
-        # Use WhatsApp API link structure
-        link = f"https://wa.me/{number}?text={quote(message)}"
-        
-        return mark_safe(f'<a href="{link}" target="_blank" style="color: green; font-weight: bold;">Open WhatsApp Chat</a>')
-    
-    get_whatsapp_link.allow_tags = True
-    get_whatsapp_link.short_description = 'WhatsApp'
-
-    def colored_status(self):
-        """
-        Displays the status field with a color for quick visual scanning.
-        Green for fulfilled, Red for pending/rejected states.
-        """
-        if self.status == 'FULFILLED':
-            color = 'green'
-        elif self.status in ['PENDING', 'REJECTED', 'CONTACT']:
-            color = 'red'
-        else:
-            color = 'black'  # Fallback
-
-        return mark_safe(f'<b style="color: {color};">{self.get_status_display()}</b>')
-    colored_status.short_description = 'Status'
-
     class Meta:
         ordering = ['request_date']
+        indexes = [
+            # Serves the admin status filter together with the default ordering.
+            models.Index(fields=['status', 'request_date']),
+            # Serves a user's request history.
+            models.Index(fields=['requester', 'request_date']),
+            # Serves the paginated community requests list, newest first.
+            models.Index(fields=['-request_date', '-id']),
+        ]
         verbose_name = "Book Request/Order"
         verbose_name_plural = "Book Requests/Orders"
@@ -0,0 +1,92 @@
+"""
+Creates a RequesterProfile for every new user, keeps
+BookAvailable.request_count and fulfilled_count in step with the
+BookRequest rows that point at each book, and drops cached pages that show
+books or requests when they change.
+"""
+from django.conf import settings
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .caching import invalidate_community_requests, invalidate_home_catalog
+from .models import BookAvailable, BookRequest, RequesterProfile
+
+
+def _counted_state(instance):
+    """
+    The (book id, is fulfilled) pair this request contributes to the counters,
+    or None if either field is deferred and reading it would cost a query.
+    """
+    values = instance.__dict__
+    if 'book_requested_id' not in values or 'status' not in values:
+        return None
+    return values['book_requested_id'], values['status'] == BookRequest.Status.FULFILLED
+
+
+def _recount(book_id):
+    if book_id:
+        requests = BookRequest.objects.filter(book_requested_id=book_id)
+        BookAvailable.objects.filter(pk=book_id).update(
+            request_count=requests.count(),
+            fulfilled_count=requests.filter(status=BookRequest.Status.FULFILLED).count(),
+        )
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def create_requester_profile(sender, instance, created, raw=False, **kwargs):
+    # Created once here, so views can use user.requesterprofile without a fallback.
+    if created and not raw:
+        RequesterProfile.objects.create(user=instance, whatsapp_name=instance.username)
+
+
+@receiver(post_init, sender=BookRequest)
+def remember_counted_state(sender, instance, **kwargs):
+    instance._counted_state = _counted_state(instance)
+
+
+@receiver(post_save, sender=BookRequest)
+@receiver(post_delete, sender=BookRequest)
+def book_request_changed(sender, **kwargs):
+    invalidate_community_requests()
+
+
+@receiver(post_save, sender=BookAvailable)
+@receiver(post_delete, sender=BookAvailable)
+def book_changed(sender, **kwargs):
+    invalidate_home_catalog()
+
+
+@receiver(post_save, sender=BookRequest)
+def update_book_request_counts(sender, instance, created, raw=False, **kwargs):
+    new = _counted_state(instance)
+    old, instance._counted_state = instance._counted_state, new
+    if raw:
+        # Fixtures carry the books' counters as they were dumped.
+        return
+    if created:
+        old = (None, False)
+
+    if old is None or new is None:
+        # Partially loaded instance: we can't tell what changed, so recount.
+        _recount(instance.book_requested_id)
+        return
+    if old == new:
+        return
+
+    old_book, old_fulfilled = old
+    new_book, new_fulfilled = new
+    if old_book == new_book:
+        BookAvailable.adjust_request_counts(new_book, fulfilled=new_fulfilled - old_fulfilled)
+    else:
+        BookAvailable.adjust_request_counts(old_book, requests=-1, fulfilled=-old_fulfilled)
+        BookAvailable.adjust_request_counts(new_book, requests=1, fulfilled=new_fulfilled)
+
+
+@receiver(post_delete, sender=BookRequest)
+def release_book_request_counts(sender, instance, **kwargs):
+    state = _counted_state(instance)
+    if state is None:
+        _recount(instance.book_requested_id)
+        return
+    book_id, fulfilled = state
+    BookAvailable.adjust_request_counts(book_id, requests=-1, fulfilled=-fulfilled)
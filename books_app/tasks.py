@@ -0,0 +1,203 @@
+"""
+Background work that shouldn't hold up the request/response cycle.
+
+Jobs run on small thread pools inside the web process and are only started
+once the surrounding database transaction commits, so they always see the
+rows that scheduled them.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import connections, transaction
+
+try:
+    import fitz # PyMuPDF
+except ImportError:
+    fitz = None
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='books-bg')
+# Book downloads can take minutes each, so they get their own threads rather
+# than queueing cover jobs behind them.
+_download_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='books-download')
+
+# Bytes read at a time when fetching a book from a URL.
+URL_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Shared HTTP session for background downloads of books added from a URL:
+# reuses connections to hosts books keep coming from and retries transient
+# gateway errors before any of the body is read.
+download_session = requests.Session()
+_DOWNLOAD_ADAPTER = HTTPAdapter(
+    pool_connections=10, pool_maxsize=10,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504)),
+)
+download_session.mount('https://', _DOWNLOAD_ADAPTER)
+download_session.mount('http://', _DOWNLOAD_ADAPTER)
+download_session.headers.update({'User-Agent': 'ebooks-supply/1.0'})
+
+# Longest edge, in pixels, of covers rendered from a PDF's first page.
+COVER_MAX_EDGE = 400
+# At this size quality 70 is visually the same as higher settings, and smaller.
+COVER_JPEG_QUALITY = 70
+
+# CPU-heavy rendering runs in separate processes so it neither holds this
+# process's GIL nor serializes behind other renders. Created on first use.
+# Every gunicorn worker has its own pool and each pool process loads MuPDF,
+# so it is kept small; beyond a few workers renders stop getting faster.
+RENDER_MAX_WORKERS = min(os.cpu_count() or 1, 4)
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def run_in_background(func, *args):
+    """Schedules func(*args) on the background pool after the current transaction commits."""
+    transaction.on_commit(lambda: _executor.submit(_run, func, *args))
+
+
+def schedule_book_download(book_id, url, file_name):
+    """Schedules download_book_file on the download pool after the current transaction commits."""
+    transaction.on_commit(lambda: _download_executor.submit(_run, download_book_file, book_id, url, file_name))
+
+
+def _run(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Background task %s failed", func.__name__)
+    finally:
+        # Each worker thread gets its own DB connection; don't leave it open.
+        connections.close_all()
+
+
+def populate_cover(book_id):
+    """
+    Fills in a book's cover and listing thumbnail. A missing cover is taken
+    from Google Books first, then from the first page of its PDF.
+    """
+    from .models import BookAvailable
+
+    book = BookAvailable.objects.filter(pk=book_id).first()
+    if book is None:
+        return
+
+    update_fields = []
+    if not book.cover_image and (book.fetch_cover_from_google_books() or book.generate_cover_from_pdf()):
+        update_fields.append('cover_image')
+    if book.cover_image and not book.cover_thumb and book.generate_cover_thumbnail():
+        update_fields.append('cover_thumb')
+    if update_fields:
+        book.save(update_fields=update_fields)
+
+
+def download_book_file(book_id, url, file_name):
+    """
+    Downloads the file for a book created from a URL and makes the book
+    available. The body is spooled to a temporary file on disk so a large PDF
+    is never held in memory whole. If anything goes wrong the placeholder row
+    is removed again, so no invisible book without a file is left behind.
+    """
+    from .models import BookAvailable
+
+    book = BookAvailable.objects.filter(pk=book_id).first()
+    if book is None:
+        return
+
+    downloaded = False
+    try:
+        with download_session.get(url, stream=True, timeout=30) as response, \
+                TemporaryUploadedFile(file_name, response.headers.get('Content-Type'), 0, None) as book_file:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=URL_DOWNLOAD_CHUNK_SIZE):
+                book_file.write(chunk)
+                if book_file.tell() > settings.MAX_BOOK_BYTES:
+                    logger.warning("Book %s from %s is over MAX_BOOK_BYTES; discarding it", book_id, url)
+                    return
+            book_file.size = book_file.tell()
+            book_file.seek(0)
+
+            # Assigned rather than saved straight to storage, so save() sees a
+            # new file and records its size and kind.
+            book.book_file = book_file
+            book.is_available = True
+            book.save()
+        downloaded = True
+    except requests.exceptions.RequestException:
+        logger.warning("Downloading book %s from %s failed", book_id, url, exc_info=True)
+    except Exception:
+        logger.exception("Storing book %s downloaded from %s failed", book_id, url)
+    finally:
+        if not downloaded:
+            # The file may already be in storage if saving the row failed.
+            if book.book_file and book.book_file._committed:
+                book.book_file.delete(save=False)
+            BookAvailable.objects.filter(pk=book_id).delete()
+
+    if downloaded:
+        populate_cover(book.pk)
+
+
+def _get_process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # 'spawn' avoids forking a process that already has threads running.
+            _process_pool = ProcessPoolExecutor(
+                max_workers=RENDER_MAX_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _process_pool
+
+
+def _discard_process_pool(pool):
+    global _process_pool
+    with _process_pool_lock:
+        # Another thread may already have replaced it.
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False)
+
+
+def run_in_process(func, *args):
+    """
+    Runs func(*args) in the shared process pool and returns its result.
+    A child dying (e.g. MuPDF crashing on a malformed PDF) breaks the whole
+    pool, so it is replaced and the call retried once on the new one.
+    """
+    for attempt in range(2):
+        pool = _get_process_pool()
+        try:
+            return pool.submit(func, *args).result()
+        except BrokenProcessPool:
+            _discard_process_pool(pool)
+            if attempt:
+                raise
+
+
+def render_first_page_jpeg(pdf_path):
+    """
+    Renders the first page of the PDF at pdf_path as a JPEG thumbnail, or
+    returns None for an empty PDF. Opening by path lets MuPDF read only the
+    pages it needs instead of loading the whole file into memory.
+    """
+    pdf_document = fitz.open(pdf_path)
+    try:
+        if len(pdf_document) == 0:
+            return None
+        first_page = pdf_document.load_page(0)
+        # Scale so the longest edge is about COVER_MAX_EDGE pixels; covers are only shown as thumbnails.
+        zoom = COVER_MAX_EDGE / max(first_page.rect.width, first_page.rect.height)
+        # No alpha channel: covers are opaque and JPEG can't store it anyway.
+        pix = first_page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csRGB, alpha=False)
+        return pix.tobytes("jpeg", jpg_quality=COVER_JPEG_QUALITY)
+    finally:
+        pdf_document.close()
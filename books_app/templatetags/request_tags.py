@@ -0,0 +1,61 @@
+"""
+Markup for showing book requests: the colored status badge and the admin's
+WhatsApp chat link. Static pieces are built once at import, so each row
+only does a dict lookup or a couple of quote() calls.
+"""
+from urllib.parse import quote
+
+from django import template
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from ..models import BookRequest
+
+register = template.Library()
+
+# Label and color per status, resolved once when the module loads.
+_STATUS_META = {
+    BookRequest.Status.PENDING: (BookRequest.Status.PENDING.label, 'red'),
+    BookRequest.Status.FULFILLED: (BookRequest.Status.FULFILLED.label, 'green'),
+    BookRequest.Status.REJECTED: (BookRequest.Status.REJECTED.label, 'red'),
+    BookRequest.Status.CONTACT: (BookRequest.Status.CONTACT.label, 'red'),
+}
+_STATUS_HTML = {
+    code: format_html('<b style="color: {};">{}</b>', color, label)
+    for code, (label, color) in _STATUS_META.items()
+}
+
+# Static pieces of the WhatsApp link.
+_WA_PREFIX = '<a href="https://wa.me/'
+_WA_MID = '?text='
+_WA_SUFFIX = '" target="_blank" style="color: green; font-weight: bold;">Open WhatsApp Chat</a>'
+_WA_MISSING = mark_safe('<span style="color: red;">Number Missing</span>')
+
+
+@register.simple_tag
+def status_badge(status):
+    """
+    Displays a request status with a color for quick visual scanning.
+    Green for fulfilled, Red for pending/rejected states.
+    """
+    html = _STATUS_HTML.get(status)
+    if html is None:
+        # Fallback for any status not in BookRequest.Status
+        html = format_html('<b style="color: black;">{}</b>', status)
+    return html
+
+
+@register.simple_tag
+def whatsapp_link(book_request):
+    """Generates a WhatsApp link for the admin to contact the requester quickly."""
+    requester = book_request.requester
+    number = requester.whatsapp_number
+    if not number:
+        return _WA_MISSING
+
+    # Generate a message to pre-fill the chat
+    message = f"Hello {requester.whatsapp_name}, regarding your request for the book: '{book_request.book_title}'."
+
+    # Use WhatsApp API link structure. Both parts are percent-encoded, so the
+    # result is safe to place inside the attribute without HTML escaping.
+    return mark_safe(_WA_PREFIX + quote(number, safe='+') + _WA_MID + quote(message) + _WA_SUFFIX)
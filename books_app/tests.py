@@ -1,3 +1,352 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import serializers
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from .models import BookAvailable, BookRequest
+from .tasks import download_book_file
+
+
+class BookRequestCountsTests(TestCase):
+    """BookAvailable.request_count/fulfilled_count follow the requests linked to each book."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pw')
+        cls.profile = cls.user.requesterprofile
+        cls.book = BookAvailable.objects.create(title='Dune', author='Frank Herbert')
+        cls.other_book = BookAvailable.objects.create(title='Emma', author='Jane Austen')
+
+    def request(self, **kwargs):
+        kwargs.setdefault('book_requested', self.book)
+        return BookRequest.objects.create(requester=self.profile, book_title='Dune', **kwargs)
+
+    def assertCounts(self, book, requests, fulfilled):
+        book.refresh_from_db(fields=['request_count', 'fulfilled_count'])
+        self.assertEqual((book.request_count, book.fulfilled_count), (requests, fulfilled))
+
+    def test_create(self):
+        self.request()
+        self.request(status=BookRequest.Status.FULFILLED)
+        self.request(book_requested=None)
+        self.assertCounts(self.book, 2, 1)
+        self.assertCounts(self.other_book, 0, 0)
+
+    def test_relink(self):
+        book_request = self.request(status=BookRequest.Status.FULFILLED)
+        book_request.book_requested = self.other_book
+        book_request.save()
+        self.assertCounts(self.book, 0, 0)
+        self.assertCounts(self.other_book, 1, 1)
+
+        book_request.book_requested = None
+        book_request.save()
+        self.assertCounts(self.other_book, 0, 0)
+
+    def test_fulfil_and_unfulfil(self):
+        book_request = self.request()
+        book_request.status = BookRequest.Status.FULFILLED
+        book_request.save()
+        self.assertCounts(self.book, 1, 1)
+
+        book_request.status = BookRequest.Status.REJECTED
+        book_request.save()
+        self.assertCounts(self.book, 1, 0)
+
+    def test_unchanged_save_keeps_counts(self):
+        book_request = self.request(status=BookRequest.Status.FULFILLED)
+        book_request.book_title = 'Dune Messiah'
+        book_request.save()
+        self.assertCounts(self.book, 1, 1)
+
+    def test_reloaded_instance(self):
+        book_request = BookRequest.objects.get(pk=self.request().pk)
+        book_request.status = BookRequest.Status.FULFILLED
+        book_request.save()
+        self.assertCounts(self.book, 1, 1)
+
+    def test_deferred_instance_recounts(self):
+        pk = self.request().pk
+        BookRequest.objects.filter(pk=pk).update(status=BookRequest.Status.FULFILLED)
+        book_request = BookRequest.objects.only('book_title').get(pk=pk)
+        book_request.book_title = 'Dune Messiah'
+        book_request.save()
+        self.assertCounts(self.book, 1, 1)
+
+    def test_delete(self):
+        book_request = self.request(status=BookRequest.Status.FULFILLED)
+        self.request()
+        book_request.delete()
+        self.assertCounts(self.book, 1, 0)
+
+        BookRequest.objects.all().delete()
+        self.assertCounts(self.book, 0, 0)
+
+    def test_drifted_counters_stay_at_zero(self):
+        book_request = self.request(status=BookRequest.Status.FULFILLED)
+        BookAvailable.objects.filter(pk=self.book.pk).update(request_count=0, fulfilled_count=0)
+        book_request.delete()
+        self.assertCounts(self.book, 0, 0)
+
+    def test_fixture_load_keeps_dumped_counts(self):
+        data = serializers.serialize('json', [self.request(status=BookRequest.Status.FULFILLED)])
+        BookRequest.objects.all().delete()
+        BookAvailable.objects.filter(pk=self.book.pk).update(request_count=1, fulfilled_count=1)
+        for obj in serializers.deserialize('json', data):
+            obj.save()
+        self.assertCounts(self.book, 1, 1)
+
+
+class MarkAsFulfilledActionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        profile = cls.admin.requesterprofile
+        cls.book = BookAvailable.objects.create(title='Dune', author='Frank Herbert')
+
+        def make(status, book):
+            return BookRequest.objects.create(requester=profile, book_title='Dune', book_requested=book, status=status)
+
+        cls.pending = make(BookRequest.Status.PENDING, cls.book)
+        cls.contact = make(BookRequest.Status.CONTACT, cls.book)
+        cls.rejected = make(BookRequest.Status.REJECTED, cls.book)
+        cls.unlinked = make(BookRequest.Status.PENDING, None)
+
+    def test_marks_open_requests_fulfilled_and_counts_them(self):
+        self.client.force_login(self.admin)
+        selected = [self.pending, self.contact, self.rejected, self.unlinked]
+        response = self.client.post(reverse('admin:books_app_bookrequest_changelist'), {
+            'action': 'mark_as_fulfilled',
+            '_selected_action': [r.pk for r in selected],
+        })
+        self.assertEqual(response.status_code, 302)
+
+        for book_request in selected:
+            book_request.refresh_from_db()
+        for book_request in (self.pending, self.contact, self.unlinked):
+            self.assertEqual(book_request.status, BookRequest.Status.FULFILLED)
+            self.assertIsNotNone(book_request.fulfillment_date)
+            self.assertTrue(book_request.last_auto_note.startswith('Automatically marked fulfilled'))
+        self.assertEqual(self.rejected.status, BookRequest.Status.REJECTED)
+        self.assertEqual(self.rejected.last_auto_note, '')
+
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.request_count, self.book.fulfilled_count), (3, 2))
+
+
+class MediaRootMixin:
+    """Keeps files saved by a test in a throwaway MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+
+@override_settings(BOOK_DOWNLOAD_ACCEL_PREFIX='')
+class DownloadBookViewTests(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('reader', password='pw'))
+        self.book = BookAvailable(title='Dune', author='Frank Herbert')
+        self.book.book_file.save('dune.txt', SimpleUploadedFile('dune.txt', b'spice'), save=False)
+        self.book.save()
+        self.url = reverse('books_app:download_book', args=[self.book.pk])
+
+    def assertDownloads(self, count):
+        self.book.refresh_from_db(fields=['download_count'])
+        self.assertEqual(self.book.download_count, count)
+
+    def test_counts_and_redirects(self):
+        response = self.client.get(self.url)
+        self.assertRedirects(response, self.book.book_file.url, fetch_redirect_response=False)
+        self.assertDownloads(1)
+
+    def test_missing_file_is_404_and_not_counted(self):
+        self.book.book_file.storage.delete(self.book.book_file.name)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertDownloads(0)
+
+
+class DetectFileKindTests(TestCase):
+    """The file kind comes from the PDF signature, not the file name."""
+
+    def kind_of(self, name, content):
+        return BookAvailable(book_file=SimpleUploadedFile(name, content))._detect_file_kind()
+
+    def test_pdf_without_pdf_extension(self):
+        self.assertEqual(self.kind_of('dune.bin', b'%PDF-1.7\n...'), BookAvailable.FileKind.PDF)
+
+    def test_pdf_extension_without_pdf_content(self):
+        self.assertEqual(self.kind_of('dune.pdf', b'PK\x03\x04 epub'), BookAvailable.FileKind.OTHER)
+
+
+class _BookFileHandler(BaseHTTPRequestHandler):
+    body = b'%PDF-1.4\n' + b'x' * 4096
+
+    def do_GET(self):
+        if self.path != '/dune.pdf':
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@mock.patch('books_app.tasks.populate_cover')
+class DownloadBookFileTests(MediaRootMixin, TestCase):
+    """download_book_file either makes the placeholder book available or removes it."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _BookFileHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+
+    def setUp(self):
+        super().setUp()
+        self.book = BookAvailable.objects.create(title='Dune', author='Frank Herbert', is_available=False)
+
+    def download(self, path):
+        download_book_file(self.book.pk, self.base_url + path, 'dune.pdf')
+
+    def assertPlaceholderRemoved(self, populate_cover):
+        self.assertFalse(BookAvailable.objects.filter(pk=self.book.pk).exists())
+        populate_cover.assert_not_called()
+
+    def test_success(self, populate_cover):
+        self.download('/dune.pdf')
+        self.book.refresh_from_db()
+        self.assertTrue(self.book.is_available)
+        self.assertEqual(self.book.file_kind, BookAvailable.FileKind.PDF)
+        self.assertEqual(self.book.file_size_bytes, len(_BookFileHandler.body))
+        with self.book.book_file.open('rb') as stored:
+            self.assertEqual(stored.read(), _BookFileHandler.body)
+        populate_cover.assert_called_once_with(self.book.pk)
+
+    @override_settings(MAX_BOOK_BYTES=1024)
+    def test_over_size_cap(self, populate_cover):
+        with self.assertLogs('books_app.tasks', 'WARNING'):
+            self.download('/dune.pdf')
+        self.assertPlaceholderRemoved(populate_cover)
+
+    def test_http_error(self, populate_cover):
+        with self.assertLogs('books_app.tasks', 'WARNING'):
+            self.download('/missing.pdf')
+        self.assertPlaceholderRemoved(populate_cover)
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Runs the schema back and forth between migrations, ending on the latest."""
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+        super().tearDown()
+
+
+class StatusToSmallIntMigrationTests(MigrationTestCase):
+    """0012 turns the old VARCHAR status codes into the integer Status values, and back."""
+
+    before = [('books_app', '0011_bookrequest_last_auto_note')]
+    after = [('books_app', '0012_bookrequest_status_smallint')]
+
+    def test_codes_become_numbers_and_back(self):
+        apps = self.migrate(self.before)
+        user = apps.get_model('auth', 'User').objects.create(username='reader')
+        profile = apps.get_model('books_app', 'RequesterProfile').objects.create(user=user, whatsapp_name='reader')
+        OldBookRequest = apps.get_model('books_app', 'BookRequest')
+        codes = ['PENDING', 'FULFILLED', 'REJECTED', 'CONTACT']
+        ids = {
+            code: OldBookRequest.objects.create(requester=profile, book_title=code, status=code).pk
+            for code in codes
+        }
+
+        apps = self.migrate(self.after)
+        NewBookRequest = apps.get_model('books_app', 'BookRequest')
+        self.assertEqual(
+            {code: NewBookRequest.objects.get(pk=pk).status for code, pk in ids.items()},
+            {
+                'PENDING': BookRequest.Status.PENDING,
+                'FULFILLED': BookRequest.Status.FULFILLED,
+                'REJECTED': BookRequest.Status.REJECTED,
+                'CONTACT': BookRequest.Status.CONTACT,
+            },
+        )
+
+        apps = self.migrate(self.before)
+        OldBookRequest = apps.get_model('books_app', 'BookRequest')
+        self.assertEqual({code: OldBookRequest.objects.get(pk=pk).status for code, pk in ids.items()},
+                         {code: code for code in codes})
+
+
+class FileSizeBackfillMigrationTests(MediaRootMixin, MigrationTestCase):
+    """0023 stores the size of files uploaded before file_size_bytes existed."""
+
+    before = [('books_app', '0022_bookavailable_avail_recent_index')]
+    after = [('books_app', '0023_backfill_file_size_bytes')]
+
+    def test_sizes_are_backfilled(self):
+        apps = self.migrate(self.before)
+        OldBook = apps.get_model('books_app', 'BookAvailable')
+        stored = OldBook(title='Dune', author='Frank Herbert')
+        stored.book_file.save('dune.txt', SimpleUploadedFile('dune.txt', b'spice'), save=False)
+        stored.save()
+        missing = OldBook.objects.create(title='Emma', author='Jane Austen', book_file='books/gone.pdf')
+
+        apps = self.migrate(self.after)
+        NewBook = apps.get_model('books_app', 'BookAvailable')
+        self.assertEqual(NewBook.objects.get(pk=stored.pk).file_size_bytes, 5)
+        self.assertIsNone(NewBook.objects.get(pk=missing.pk).file_size_bytes)
+
+
+class FileKindSniffMigrationTests(MediaRootMixin, MigrationTestCase):
+    """0024 replaces 0017's extension-based guess with the file's signature."""
+
+    before = [('books_app', '0023_backfill_file_size_bytes')]
+    after = [('books_app', '0024_sniff_existing_file_kinds')]
+
+    def test_kinds_follow_content(self):
+        apps = self.migrate(self.before)
+        OldBook = apps.get_model('books_app', 'BookAvailable')
+
+        def make(name, content, kind):
+            book = OldBook(title=name, author='Anon', file_kind=kind)
+            book.book_file.save(name, SimpleUploadedFile(name, content), save=False)
+            book.save()
+            return book.pk
+
+        fake_pdf = make('fake.pdf', b'not a pdf', 'pdf')
+        real_pdf = make('real.bin', b'%PDF-1.4\n', 'other')
+
+        apps = self.migrate(self.after)
+        NewBook = apps.get_model('books_app', 'BookAvailable')
+        self.assertEqual(NewBook.objects.get(pk=fake_pdf).file_kind, 'other')
+        self.assertEqual(NewBook.objects.get(pk=real_pdf).file_kind, 'pdf')
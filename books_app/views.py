@@ -1,53 +1,78 @@
 from django.shortcuts import render, HttpResponse, redirect, get_object_or_404
+from django.http import Http404
 from .models import BookAvailable, RequesterProfile, BookRequest
+from .caching import community_requests_version, home_catalog_version
+from .tasks import schedule_book_download
 from .forms import (
     BookRequestForm, CustomUserCreationForm, UserUpdateForm, BookUploadForm, BookUploadURLForm, CustomPasswordChangeForm,
     ProfileUpdateForm,
 )
-from django.contrib.auth.forms import AuthenticationForm, PasswordChangeForm
-from django.contrib.auth import login, logout, update_session_auth_hash, get_user_model
+from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.auth import login, logout, update_session_auth_hash
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q
+from django.db.models import F, Q
+from django.core.cache import cache
+from django.core.paginator import Paginator
 from django.utils import timezone
-import requests
-from django.core.files.base import ContentFile
+from django.utils.http import content_disposition_header
+from django.conf import settings
+from urllib.parse import quote
+import hashlib
+import mimetypes
 import os
 
-# Check if the PDF processing library is installed.
-try:
-    import fitz  # PyMuPDF
-except ImportError:
-    fitz = None
-
 # Create your views here.
 
+# Number of books shown per page on the home catalog.
+HOME_PAGE_SIZE = 24
+# Seconds a cached catalog page may live. Editing a book drops it sooner;
+# view/download counters are updated in SQL and just catch up on expiry.
+HOME_CACHE_TIMEOUT = 60
+# Number of requests shown per page on the community requests list.
+REQUESTS_PAGE_SIZE = 30
+# Columns the request history lists (my_requests.html, request_history_list.html) show.
+REQUEST_HISTORY_FIELDS = ('book_title', 'book_author', 'status', 'request_date')
+
 @login_required
 def home(request):
-    queryset = BookAvailable.objects.filter(is_available=True).order_by('-published_date', 'title')
+    # Only the columns the catalog cards render, in the order the index serves.
+    queryset = BookAvailable.objects.filter(is_available=True).only(
+        'title', 'author', 'book_file', 'cover_image', 'cover_thumb', 'published_date', 'view_count', 'download_count',
+        'file_size_bytes'
+    ).order_by('-published_date', 'title')
     query = request.GET.get('q')
 
     if query:
         # Filter by title or author, case-insensitively
+        # No JOINs are involved, so rows can't repeat and DISTINCT would only add a sort.
         queryset = queryset.filter(
             Q(title__icontains=query) | Q(author__icontains=query)
-        ).distinct()
-    return render(request, 'books_app/home.html', {'books': queryset, 'query': query})
+        )
+
+    # The catalog is the same for everyone, so cache each page and the total
+    # per search term until a book is added, changed or removed.
+    cache_prefix = f"home:{home_catalog_version()}:{hashlib.sha1((query or '').encode()).hexdigest()}"
+    paginator = Paginator(queryset, HOME_PAGE_SIZE)
+    paginator.count = cache.get_or_set(f'{cache_prefix}:count', queryset.count, HOME_CACHE_TIMEOUT)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    books = cache.get_or_set(
+        f'{cache_prefix}:p{page_obj.number}', lambda: list(page_obj.object_list), HOME_CACHE_TIMEOUT
+    )
+    return render(request, 'books_app/home.html', {'books': books, 'page_obj': page_obj, 'query': query})
 
 @login_required
 def book_detail_view(request, pk):
     """
     Displays a single book's details and provides a preview if it's a PDF.
     """
-    from django.db.models import F
-
     book = get_object_or_404(BookAvailable, pk=pk, is_available=True)
     
     # Increment the view count atomically to prevent race conditions
     BookAvailable.objects.filter(pk=pk).update(view_count=F('view_count') + 1)
     
-    # Refresh the object from the DB to get the updated count
-    book.refresh_from_db()
+    # Reflect the increment locally rather than re-reading the whole row
+    book.view_count += 1
 
     context = {'book': book}
     return render(request, 'books_app/book_detail.html', context)
@@ -56,15 +81,33 @@ def book_detail_view(request, pk):
 @login_required
 def download_book_view(request, pk):
     """
-    This view handles tracking the download count and then redirects to the actual file.
-    """
-    from django.db.models import F
+    Counts the download and sends the book file as an attachment.
 
-    book = get_object_or_404(BookAvailable, pk=pk)
+    With BOOK_DOWNLOAD_ACCEL_PREFIX set, nginx streams the file itself from its
+    internal location and the worker is free as soon as the headers go out.
+    Otherwise the browser is redirected to the file's media URL.
+    """
+    book = get_object_or_404(BookAvailable.objects.only('title', 'book_file'), pk=pk)
+    if not book.book_file:
+        raise Http404("This book has no file attached.")
+    # Check before counting so a file missing from storage is a 404, not a
+    # counted download that fails later.
+    if not book.book_file.storage.exists(book.book_file.name):
+        raise Http404("This book's file is missing.")
     BookAvailable.objects.filter(pk=pk).update(download_count=F('download_count') + 1)
-    
-    # Redirect to the actual file URL for the browser to handle the download
+
+    accel_prefix = settings.BOOK_DOWNLOAD_ACCEL_PREFIX
+    if accel_prefix:
+        filename = book.title + os.path.splitext(book.book_file.name)[1]
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = accel_prefix + quote(book.book_file.name)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        # Let nginx pick the type from the file it serves.
+        del response['Content-Type']
+        return response
+
     return redirect(book.book_file.url)
+
 @login_required
 def request_book(request):
     if request.method == 'POST':
@@ -84,16 +127,12 @@ def request_book(request):
 
 @login_required
 def my_requests(request):
-    # Fetch requests directly for the logged-in user.
-    try:
-        # Get the user's profile, which is linked to their requests.
-        profile = request.user.requesterprofile
-        requests_list = BookRequest.objects.filter(requester=profile).order_by('-request_date')
-    except RequesterProfile.DoesNotExist:
-        # This is a fallback in case a user (like a superuser) doesn't have a profile.
-        requests_list = []
-        messages.warning(request, "Your requester profile could not be found. Please visit your account page to ensure it's set up correctly.")
-        
+    # Fetch requests directly for the logged-in user. Going through the profile's
+    # user column means a user without a profile (like a superuser) simply has none.
+    requests_list = BookRequest.objects.filter(requester__user=request.user).only(
+        *REQUEST_HISTORY_FIELDS
+    ).order_by('-request_date')
+
     return render(request, 'books_app/my_requests.html', {'requests_list': requests_list})
 
 @login_required
@@ -101,8 +140,15 @@ def all_requests_view(request):
     """
     Displays all book requests from all users to the community.
     """
-    all_requests = BookRequest.objects.all().order_by('-request_date')
-    return render(request, 'books_app/all_requests.html', {'requests_list': all_requests})
+    # The list shows each requester's name, so JOIN it instead of querying per row.
+    # id breaks ties between requests made at the same moment so pages don't overlap.
+    all_requests = BookRequest.objects.select_related('requester').order_by('-request_date', '-id')
+    page_obj = Paginator(all_requests, REQUESTS_PAGE_SIZE).get_page(request.GET.get('page'))
+    return render(request, 'books_app/all_requests.html', {
+        'requests_list': page_obj.object_list,
+        'page_obj': page_obj,
+        'cache_version': community_requests_version(),
+    })
 
 @login_required
 def upload_book_view(request, request_id=None):
@@ -112,38 +158,38 @@ def upload_book_view(request, request_id=None):
     """
     book_request_to_fulfill = None
     if request_id:
-        try:
-            book_request_to_fulfill = BookRequest.objects.get(id=request_id, status='PENDING')
-        except BookRequest.DoesNotExist:
+        # The page shows the requester's name, so fetch it in the same query.
+        book_request_to_fulfill = BookRequest.objects.filter(
+            id=request_id, status=BookRequest.Status.PENDING
+        ).select_related('requester').first()
+        if book_request_to_fulfill is None:
             messages.error(request, "This book request could not be found or has already been fulfilled.")
             return redirect('books_app:all_requests')
 
     if request.method == 'POST':
         form = BookUploadForm(request.POST, request.FILES)
         if form.is_valid():
-            # Check if the uploaded file is a PDF and if the library is missing
-            uploaded_file = request.FILES.get('book_file')
-
-            # The model's save() method will handle the cover generation if fitz is available.
+            # The model's save() detects a PDF from the file's content and
+            # schedules cover lookup/generation in the background.
             new_book = form.save()
 
             # If this upload is meant to fulfill a specific request
             if book_request_to_fulfill:
                 book_request_to_fulfill.book_requested = new_book
-                book_request_to_fulfill.status = 'FULFILLED'
+                book_request_to_fulfill.status = BookRequest.Status.FULFILLED
                 book_request_to_fulfill.fulfillment_date = timezone.now()
                 book_request_to_fulfill.save()
                 msg = f"Thank you! You have successfully uploaded '{new_book.title}' and fulfilled the request."
                 if new_book.cover_image:
-                    messages.success(request, msg + " A cover image was found automatically!")
+                    messages.success(request, msg)
                 else:
-                    messages.info(request, msg + " A cover image could not be found automatically.")
+                    messages.info(request, msg + " We're looking for a cover image in the background.")
                 return redirect('books_app:all_requests')
             
             if new_book.cover_image:
-                messages.success(request, f"Thank you! '{new_book.title}' has been added, and a cover was found automatically!")
+                messages.success(request, f"Thank you! '{new_book.title}' has been added.")
             else:
-                messages.info(request, f"Thank you! '{new_book.title}' has been added. A cover could not be found automatically, but you can add one later.")
+                messages.info(request, f"Thank you! '{new_book.title}' has been added. We're looking for a cover in the background; if none turns up, you can add one later.")
             return redirect('books_app:home')
     else:
         # Pre-populate the form with data from the request if it exists.
@@ -163,27 +209,25 @@ def upload_book_from_url_view(request):
         form = BookUploadURLForm(request.POST, request.FILES)
         if form.is_valid():
             book_url = form.cleaned_data['book_url']
-            try:
-                # Download the book file from the URL
-                response = requests.get(book_url, stream=True, timeout=30)
-                response.raise_for_status()  # Raise an exception for bad status codes
-
-                # Create a new book instance but don't save to DB yet
-                new_book = form.save(commit=False)
 
-                # Get the filename from the URL
-                file_name = os.path.basename(book_url.split('?')[0])
-                if not file_name:
-                    file_name = "downloaded_book.pdf" # Fallback filename
-
-                # Save the downloaded content to the book_file field
-                new_book.book_file.save(file_name, ContentFile(response.content), save=True)
-
-                messages.success(request, f"Successfully downloaded and saved '{new_book.title}' from the URL.")
-                return redirect('books_app:home')
-
-            except requests.exceptions.RequestException as e:
-                messages.error(request, f"Failed to download the book from the URL. Error: {e}")
+            # Get the filename from the URL, taking the extension from the
+            # server's Content-Type when the URL doesn't carry one.
+            file_name = os.path.basename(book_url.split('?')[0]) or "downloaded_book"
+            if not os.path.splitext(file_name)[1]:
+                file_name += mimetypes.guess_extension(form.book_content_type or '') or '.pdf'
+
+            # Keep the book out of the catalog until its file has arrived; the
+            # download runs in the background so this request returns at once.
+            new_book = form.save(commit=False)
+            new_book.is_available = False
+            new_book.save()
+            schedule_book_download(new_book.pk, book_url, file_name)
+
+            messages.success(
+                request,
+                f"'{new_book.title}' is being downloaded from the URL. It will appear in the catalog when the download finishes."
+            )
+            return redirect('books_app:home')
     else:
         form = BookUploadURLForm()
     return render(request, 'books_app/upload_from_url.html', {'form': form})
@@ -208,31 +252,29 @@ def contact(request):
 
 @login_required
 def account(request):
-    # Ensure a profile exists for the user, creating one if it doesn't.
-    # This makes the view robust for any user, including superusers.
-    profile, created = RequesterProfile.objects.get_or_create(user=request.user,
-        defaults={
-            'whatsapp_name': request.user.username,
-            'whatsapp_number': None # Explicitly set to None on creation
-        }
-    )
+    # Every user gets a profile when created (see signals.py), and it arrives
+    # together with request.user, so this is normally no query at all. An admin
+    # can still delete a profile, so recreate it if it's gone.
+    try:
+        profile = request.user.requesterprofile
+    except RequesterProfile.DoesNotExist:
+        profile = RequesterProfile.objects.create(
+            user=request.user,
+            whatsapp_name=request.user.username,
+            whatsapp_number=None # Explicitly set to None on creation
+        )
 
     # Fetch the user's request history to display in a tab.
     # This needs to be done for both GET and POST requests.
-    try:
-        requests_list = BookRequest.objects.filter(requester=profile).order_by('-request_date')
-    except RequesterProfile.DoesNotExist:
-        # This is a safe fallback, though get_or_create should prevent it.
-        requests_list = []
+    requests_list = BookRequest.objects.filter(requester=profile).only(*REQUEST_HISTORY_FIELDS).order_by('-request_date')
 
-    if request.method == 'POST':
-        # Initialize all forms to ensure they exist in the context
-        u_form = UserUpdateForm(instance=request.user)
-        p_form = ProfileUpdateForm(instance=profile)
-        password_form = CustomPasswordChangeForm(request.user)
+    # Only the submitted form is bound; the others are built unbound below.
+    u_form = p_form = password_form = None
 
+    if request.method == 'POST':
         # Check which form is being submitted
-        if 'update_profile' in request.POST:
+        action = request.POST.get('action')
+        if action == 'update_profile':
             u_form = UserUpdateForm(request.POST, instance=request.user)
             p_form = ProfileUpdateForm(request.POST, request.FILES, instance=profile)
             if u_form.is_valid() and p_form.is_valid():
@@ -241,7 +283,7 @@ def account(request):
                 messages.success(request, 'Your account has been updated!')
                 return redirect('books_app:account')
         
-        elif 'change_password' in request.POST:
+        elif action == 'change_password':
             password_form = CustomPasswordChangeForm(request.user, request.POST)
             if password_form.is_valid():
                 user = password_form.save()
@@ -250,9 +292,11 @@ def account(request):
                 return redirect('books_app:account')
             else:
                 messages.error(request, 'Please correct the password errors below.')
-    else:
+
+    if u_form is None:
         u_form = UserUpdateForm(instance=request.user)
         p_form = ProfileUpdateForm(instance=profile)
+    if password_form is None:
         password_form = CustomPasswordChangeForm(request.user)
     
     context = {